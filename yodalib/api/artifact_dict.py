@@ -16,14 +16,14 @@ class ArtifactDict(dict):
         self._di = decompiler_interface
         self._error_on_duplicate = error_on_duplicate
         self._art_function = {
-            # ArtifactType: (setter, getter, lister)
-            Function: (self._di._set_function, self._di._get_function, self._di._functions),
-            StackVariable: (self._di._set_stack_variable, self._di._get_stack_variable, self._di._stack_variables),
-            GlobalVariable: (self._di._set_global_variable, self._di._get_global_var, self._di._global_vars),
-            Struct: (self._di._set_struct, self._di._get_struct, self._di._structs),
-            Enum: (self._di._set_enum, self._di._enums, self._di._enums),
-            Comment: (self._di._set_comment, self._di._get_comment, self._di._comments),
-            Patch: (self._di._set_patch, self._di._get_patch, self._di._patches)
+            # ArtifactType: (getter, lister)
+            Function: (self._di._get_function, self._di._functions),
+            StackVariable: (self._di._get_stack_variable, self._di._stack_variables),
+            GlobalVariable: (self._di._get_global_var, self._di._global_vars),
+            Struct: (self._di._get_struct, self._di._structs),
+            Enum: (self._di._enums, self._di._enums),
+            Comment: (self._di._get_comment, self._di._comments),
+            Patch: (self._di._get_patch, self._di._patches)
         }
 
         functions = self._art_function.get(artifact_cls, None)
@@ -31,7 +31,7 @@ class ArtifactDict(dict):
             raise ValueError(f"Attempting to create a dict for a Artifact class that is not supported: {artifact_cls}")
 
         self._artifact_class = artifact_cls
-        self._artifact_setter, self._artifact_getter, self._artifact_lister = functions
+        self._artifact_getter, self._artifact_lister = functions
 
     def __len__(self):
         return len(self._artifact_lister())
@@ -44,7 +44,8 @@ class ArtifactDict(dict):
         return data
 
     def __setitem__(self, key, value):
-        if not self._artifact_setter(value) and self._error_on_duplicate:
+        # sets go through the interface, so they are lowered, guarded, and invalidate cached decompilations
+        if not self._di.set_artifact(value) and self._error_on_duplicate:
             raise ValueError(f"Set value {value} is already present at key {key}")
 
     def __contains__(self, item):
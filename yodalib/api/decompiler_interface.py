@@ -1,8 +1,12 @@
+import bisect
+import importlib.util
 import inspect
 import logging
+import sys
 import threading
-from collections import defaultdict
-from functools import wraps
+import time
+from collections import OrderedDict, ChainMap
+from functools import lru_cache
 from typing import Dict, Optional, Union, Tuple
 
 import yodalib
@@ -21,14 +25,6 @@ from yodalib.decompilers import YODALIB_SUPPORTED_DECOMPILERS, ANGR_DECOMPILER,
 _l = logging.getLogger(name=__name__)
 
 
-def artifact_set_event(f):
-    @wraps(f)
-    def _artifact_set_event(self: "DecompilerInterface", *args, **kwargs):
-        return self.artifact_set_event_handler(f, *args, **kwargs)
-
-    return _artifact_set_event
-
-
 class DummyArtifactSetLock:
     def __enter__(self):
         pass
@@ -38,13 +34,90 @@ class DummyArtifactSetLock:
 
 
 class DecompilerInterface:
+    __slots__ = (
+        "headless",
+        "artifact_lifer",
+        "type_parser",
+        "_parse_type_cached",
+        "_error_on_artifact_duplicates",
+        "_artifact_set_state",
+        "_artifact_set_locks",
+        "_artifact_set_fallback_lock",
+        "_func_index_starts",
+        "_func_index_vals",
+        "_func_index_version",
+        "_func_index_time",
+        "_func_index_ttl",
+        "_functions_version",
+        "_decompilation_cache",
+        "_decompilation_cache_size",
+        "_decompilation_versions",
+        "_decompilation_generation",
+        "_decompilation_cache_lock",
+        "_setters",
+        "functions",
+        "stack_vars",
+        "comments",
+        "enums",
+        "structs",
+        "patches",
+    )
+
+    # ArtifactType: name of the setter used by set_artifact
+    _ARTIFACT_SETTERS = {
+        Function: "_set_function",
+        FunctionHeader: "_set_function_header",
+        StackVariable: "_set_stack_variable",
+        Comment: "_set_comment",
+        GlobalVariable: "_set_global_variable",
+        Struct: "_set_struct",
+        Enum: "_set_enum",
+        Patch: "_set_patch",
+    }
+
     def __init__(self, artifact_lifter: Optional[ArtifactLifter] = None, headless: bool = False, error_on_artifact_duplicates=False):
         self.headless = headless
         self.artifact_lifer = artifact_lifter
         self.type_parser = CTypeParser()
+        # parsed CTypes are never mutated, so results can be shared across calls with the same type string
+        self._parse_type_cached = lru_cache(maxsize=4096)(self.type_parser.parse_type)
         self._error_on_artifact_duplicates = True
 
-        self.artifact_set_lock = threading.Lock()
+        # per-thread marker for being inside an artifact set, so callbacks fired by our own sets can be ignored
+        self._artifact_set_state = threading.local()
+        # setting a Function also sets its header and stack vars, so those three share one lock and can't
+        # interleave with each other on another thread. Every other type (comments included) has its own lock.
+        function_lock = threading.Lock()
+        self._artifact_set_locks = {
+            Function: function_lock,
+            FunctionHeader: function_lock,
+            StackVariable: function_lock,
+            Comment: threading.Lock(),
+            GlobalVariable: threading.Lock(),
+            Struct: threading.Lock(),
+            Enum: threading.Lock(),
+            Patch: threading.Lock(),
+        }
+        self._artifact_set_fallback_lock = threading.Lock()
+
+        # sorted index of light functions, used for fast address containment lookups
+        self._func_index_starts = []
+        self._func_index_vals = []
+        self._func_index_version = -1
+        # seconds a snapshot of `_functions` is trusted before a lookup re-enumerates the decompiler
+        self._func_index_time = 0.0
+        self._func_index_ttl = 0.25
+        self._functions_version = 0
+
+        # LRU of decompilations, keyed by function identity, a global generation, and a per-function version
+        self._decompilation_cache = OrderedDict()
+        self._decompilation_cache_size = 256
+        self._decompilation_versions: Dict[int, int] = {}
+        self._decompilation_generation = 0
+        self._decompilation_cache_lock = threading.Lock()
+
+        # setters bound once, so set_artifact does no per-call method lookup
+        self._setters = {art_cls: getattr(self, name) for art_cls, name in self._ARTIFACT_SETTERS.items()}
 
         # artifacts
         self.functions = ArtifactDict(Function, self, error_on_duplicate=error_on_artifact_duplicates)
@@ -128,32 +201,112 @@ class DecompilerInterface:
         if not self.decompiler_available:
             return None
 
-        # TODO: make this a function call after transitioning decompiler artifacts to LiveState
-        for search_addr in (addr, self.artifact_lifer.lower_addr(addr)):
-            func_found = False
-            for func_addr, func in self._functions().items():
-                if func.addr <= search_addr < (func.addr + func.size):
-                    func_found = True
-                    break
-            else:
-                func = None
-
-            if func_found:
-                break
-        else:
+        # functions are listed in the decompiler's address space, so only the lowered address needs a search
+        func = self._find_function(self.artifact_lifer.lower_addr(addr))
+        if func is None:
             return None
 
+        with self._decompilation_cache_lock:
+            cache_key = (
+                func.addr, func.size, self._decompilation_generation, self._decompilation_versions.get(func.addr, 0)
+            )
+            decompilation = self._decompilation_cache.get(cache_key, None)
+            if decompilation is not None:
+                self._decompilation_cache.move_to_end(cache_key)
+                return decompilation
+
         try:
             decompilation = self._decompile(func)
         except Exception as e:
             _l.warning(f"Failed to decompile function at {hex(addr)}: {e}")
             decompilation = None
 
+        if decompilation is not None:
+            with self._decompilation_cache_lock:
+                self._decompilation_cache[cache_key] = decompilation
+                if len(self._decompilation_cache) > self._decompilation_cache_size:
+                    self._decompilation_cache.popitem(last=False)
+
         return decompilation
 
     def _decompile(self, function: Function) -> Optional[str]:
         raise NotImplementedError
 
+    def _find_function(self, addr: int) -> Optional[Function]:
+        """
+        Returns the light Function (as listed by `_functions`) that contains addr, which must be in the
+        decompiler's address space. The lookup is a binary search over a sorted index of function start addresses.
+        The index is a snapshot of `_functions` that is rebuilt when a Function is set through the interface, and
+        since the decompiler may also create, delete, or resize functions natively, whenever it is older than
+        `_func_index_ttl` seconds. Bursts of lookups still share one enumeration.
+
+        @param addr:
+        @return:
+        """
+        if self._func_index_version != self._functions_version or \
+                time.monotonic() - self._func_index_time >= self._func_index_ttl:
+            self._build_function_index()
+
+        return self._search_function_index(addr)
+
+    def _invalidate_decompilation(self, func_addr: Optional[int] = None):
+        """
+        Marks cached decompilations as stale, either only for the function at func_addr or, if func_addr is None,
+        for every function. Backends that observe native changes in the decompiler must call this (or
+        `_invalidate_artifact_decompilation`), otherwise `decompile` can return outdated text.
+
+        @param func_addr:   Lowered address of the changed function, or None to invalidate everything
+        @return:
+        """
+        with self._decompilation_cache_lock:
+            if func_addr is None:
+                # the generation is part of the key, so decompilations already in flight are never cached as fresh
+                self._decompilation_generation += 1
+                self._decompilation_cache.clear()
+            else:
+                self._decompilation_versions[func_addr] = self._decompilation_versions.get(func_addr, 0) + 1
+
+    def _invalidate_artifact_decompilation(self, artifact: Artifact):
+        """
+        Invalidates the cached decompilations that a (lowered) artifact may show up in. Stack variables and comments
+        only show up in their own function. Everything else, including function headers, which are visible in
+        every caller, can show up in any decompilation.
+
+        @param artifact:
+        @return:
+        """
+        if isinstance(artifact, StackVariable):
+            self._invalidate_decompilation(artifact.addr)
+        elif isinstance(artifact, Function) and artifact.header is None:
+            self._invalidate_decompilation(artifact.addr)
+        elif isinstance(artifact, Comment):
+            func_addr = artifact.func_addr
+            if func_addr is None:
+                func = self._find_function(artifact.addr)
+                func_addr = func.addr if func is not None else None
+
+            # comments outside of functions are not in any decompilation
+            if func_addr is not None:
+                self._invalidate_decompilation(func_addr)
+        else:
+            self._invalidate_decompilation()
+
+    def _build_function_index(self):
+        # _functions is keyed by start address, so sorting the int keys avoids a Python-level key function
+        funcs = self._functions()
+        self._func_index_starts = sorted(funcs)
+        self._func_index_vals = [funcs[addr] for addr in self._func_index_starts]
+        self._func_index_version = self._functions_version
+        self._func_index_time = time.monotonic()
+
+    def _search_function_index(self, addr: int) -> Optional[Function]:
+        idx = bisect.bisect_right(self._func_index_starts, addr) - 1
+        if idx < 0:
+            return None
+
+        func = self._func_index_vals[idx]
+        return func if addr < func.addr + func.size else None
+
     #
     # Optional Artifact API:
     # A series of functions that allow public access to live artifacts in the decompiler. As an example,
@@ -187,6 +340,22 @@ class DecompilerInterface:
         """
         return {}
 
+    def _functions_full(self, **kwargs) -> Dict[int, Function]:
+        """
+        Returns a dict of live yodalib.Functions, with headers and stack vars, for every function in the decompiler.
+        Backends that can collect all of this in a single enumeration should override this to avoid the default
+        `_get_function` call per function.
+
+        @return:
+        """
+        funcs = {}
+        for addr in self._functions():
+            func = self._get_function(addr, **kwargs)
+            if func is not None:
+                funcs[addr] = func
+
+        return funcs
+
     # stack vars
     def _set_stack_variable(self, svar: StackVariable, **kwargs) -> bool:
         return False
@@ -199,13 +368,11 @@ class DecompilerInterface:
         return func.stack_vars.get(offset, None)
 
     def _stack_variables(self, **kwargs) -> Dict[Tuple[int, int], StackVariable]:
-        stack_vars = defaultdict(dict)
-        for addr in self._functions():
-            func = self._get_function(addr, **kwargs)
-            for svar in func.stack_vars.values():
-                stack_vars[addr][svar.offset] = svar
-
-        return dict(stack_vars)
+        return {
+            (addr, svar.offset): svar
+            for addr, func in self._functions_full(**kwargs).items()
+            for svar in func.stack_vars.values()
+        }
 
     # global variables
     def _set_global_variable(self, gvar: GlobalVariable, **kwargs) -> bool:
@@ -299,13 +466,12 @@ class DecompilerInterface:
         Returns a light version of all artifacts that are global (non function associated):
         - structs, gvars, enums
 
+        The result is a view over the backend dicts, rather than a merged copy. Like `global_artifact`,
+        a struct shadows an enum of the same name.
+
         @return:
         """
-        g_artifacts = {}
-        for f in [self._structs, self._global_vars, self._enums]:
-            g_artifacts.update(f())
-
-        return g_artifacts
+        return ChainMap(self._structs(), self._global_vars(), self._enums())
 
     def global_artifact(self, lookup_item: Union[str, int]):
         """
@@ -342,27 +508,22 @@ class DecompilerInterface:
         @param lower:       Wether to convert the Artifacts types and offset into the local decompilers format
         @return:            True if the Artifact was succesfuly set into the decompiler
         """
-        set_map = {
-            Function: self._set_function,
-            FunctionHeader: self._set_function_header,
-            StackVariable: self._set_stack_variable,
-            Comment: self._set_comment,
-            GlobalVariable: self._set_global_variable,
-            Struct: self._set_struct,
-            Enum: self._set_enum,
-            Patch: self._set_patch,
-            Artifact: None,
-        }
-
-        if lower:
-            artifact = self.lower_artifact(artifact)
-
-        setter = set_map.get(type(artifact), None)
+        setter = self._setters.get(type(artifact), None)
         if setter is None:
             _l.critical(f"Unsupported object is attempting to be set, please check your object: {artifact}")
             return False
 
-        return setter(artifact, **kwargs)
+        if lower:
+            artifact = self.lower_artifact(artifact)
+
+        try:
+            return self.artifact_set_event_handler(setter, artifact, lower=False, catch_errors=False, **kwargs)
+        finally:
+            # invalidate only once the setter is done (or failed part way), so a lookup or decompile racing with
+            # the set can't cache the old state under the new version
+            if isinstance(artifact, Function):
+                self._functions_version += 1
+            self._invalidate_artifact_decompilation(artifact)
 
     #
     # Change Callback API
@@ -408,34 +569,59 @@ class DecompilerInterface:
     #
 
     def artifact_set_event_handler(
-        self, setter_func, artifact: Artifact, *args, **kwargs
+        self, setter_func, artifact: Artifact, *args, lower=True, catch_errors=True, **kwargs
     ):
         """
         This function handles any event which tries to set an Artifact into the decompiler. This handler does two
         important tasks:
-        1. Locks callback handlers, so you don't get infinite callbacks
-        2. "Lowers" the artifact, so it's data types match the decompilers
-
+        1. Marks the current thread as setting an Artifact, so callback handlers can check
+           `artifact_set_in_progress` and you don't get infinite callbacks. Sets from other threads are only
+           blocked if they write the same kind of data: function data (functions, headers, stack vars) or the
+           same other Artifact type. A set nested in another set on the same thread runs under the lock
+           already held, so a thread never waits on a second lock and sets can't deadlock on lock order.
+        2. "Lowers" the artifact, so it's data types match the decompilers, unless lower is False
+
+        A ValueError from the setter is treated as no change, unless catch_errors is False. Every set done through
+        `set_artifact`, including sets on the ArtifactDicts, goes through this handler with errors propagated.
         Because of this, it's recommended that when overriding this function you always call super() at the end of
         your override so it's set correctly in the decompiler.
 
         :param setter_func:
         :param artifact:
         :param args:
+        :param lower:
+        :param catch_errors:
         :param kwargs:
         :return:
         """
 
-        lowered_artifact = self.lower_artifact(artifact)
-        lock = self.artifact_set_lock if not self.artifact_set_lock.locked() else DummyArtifactSetLock()
-        with lock:
-            try:
+        lowered_artifact = self.lower_artifact(artifact) if lower else artifact
+        was_setting = self.artifact_set_in_progress
+        if was_setting:
+            lock = DummyArtifactSetLock()
+        else:
+            lock = self._artifact_set_locks.get(type(artifact), self._artifact_set_fallback_lock)
+        self._artifact_set_state.setting = True
+        try:
+            with lock:
                 had_changes = setter_func(lowered_artifact, **kwargs)
-            except ValueError:
-                had_changes = False
+        except ValueError:
+            if not catch_errors:
+                raise
+
+            had_changes = False
+        finally:
+            self._artifact_set_state.setting = was_setting
 
         return had_changes
 
+    @property
+    def artifact_set_in_progress(self) -> bool:
+        """
+        @return: True if the current thread is inside `artifact_set_event_handler`
+        """
+        return getattr(self._artifact_set_state, "setting", False)
+
     #
     # Utils
     #
@@ -444,7 +630,7 @@ class DecompilerInterface:
         if not type_str:
             return None
 
-        type_: CType = self.type_parser.parse_type(type_str)
+        type_: CType = self._parse_type_cached(type_str)
         if not type_:
             # it was not parseable
             return None
@@ -457,15 +643,25 @@ class DecompilerInterface:
         return base_type_str if base_type_str in state._structs.keys() else None
 
     @staticmethod
-    def _find_global_in_call_frames(global_name, max_frames=10):
-        curr_frame = inspect.currentframe()
-        outer_frames = inspect.getouterframes(curr_frame, max_frames)
-        for frame in outer_frames:
-            global_data = frame.frame.f_globals.get(global_name, None)
+    def _find_global_in_call_frames(global_name):
+        # walk the whole stack directly, since inspect.getouterframes reads source context for every frame
+        frame = inspect.currentframe()
+        while frame is not None:
+            global_data = frame.f_globals.get(global_name, None)
             if global_data is not None:
                 return global_data
-        else:
-            return None
+
+            frame = frame.f_back
+
+        return None
+
+    @staticmethod
+    def _module_available(module_name):
+        try:
+            return importlib.util.find_spec(module_name) is not None
+        except ValueError:
+            # modules injected by a host application may be loaded without a spec
+            return module_name in sys.modules
 
     @staticmethod
     def discover_interface(force_decompiler: str = None, **ctrl_kwargs) -> Optional["DecompilerInterface"]:
@@ -479,29 +675,12 @@ class DecompilerInterface:
         if force_decompiler and force_decompiler not in YODALIB_SUPPORTED_DECOMPILERS:
             raise ValueError(f"Unsupported decompiler {force_decompiler}")
 
-        has_ida = False
-        has_binja = False
-        has_angr = False
-        is_ghidra = False
-
-        try:
-            import idaapi
-            has_ida = True
-        except ImportError:
-            pass
-
-        try:
-            import binaryninja
-            has_binja = True
-        except ImportError:
-            pass
-
-        try:
-            import angr
-            import angrmanagement
-            has_angr = DecompilerInterface._find_global_in_call_frames('workspace') is not None
-        except ImportError:
-            pass
+        # only probe for the modules here, importing them can run seconds of plugin initialization
+        has_ida = DecompilerInterface._module_available("idaapi")
+        has_binja = DecompilerInterface._module_available("binaryninja")
+        has_angr = DecompilerInterface._module_available("angr") and \
+            DecompilerInterface._module_available("angrmanagement") and \
+            DecompilerInterface._find_global_in_call_frames('workspace') is not None
 
         # we assume if we are nothing else, then we are Ghidra
         is_ghidra = not(has_ida or has_binja or has_angr)
@@ -86,12 +86,15 @@ class IDBHooks(ida_idp.IDB_Hooks):
     @stop_if_syncing
     def local_types_changed(self):
         #print("local type changed")
+        self.controller._invalidate_decompilation()
         return 0
 
     @quite_init_checker
     @stop_if_syncing
     def ti_changed(self, ea, type_, fname):
         #print(f"TI CHANGED: {ea}, {type_}, {fname}")
+        # a prototype or global type is visible in every function referencing it
+        self.controller._invalidate_decompilation()
         return 0
 
     #
@@ -356,6 +359,7 @@ class IDBHooks(ida_idp.IDB_Hooks):
     @quite_init_checker
     @stop_if_syncing
     def byte_patched(self, ea, old_value):
+        self.controller._invalidate_decompilation()
         return 0
 
     @quite_init_checker
@@ -478,8 +482,9 @@ class IDBHooks(ida_idp.IDB_Hooks):
         )
         return 0
 
-    def yodalib_state_change(self, *args, **kwargs):
-        self.controller.schedule_job(*args, **kwargs)
+    def yodalib_state_change(self, callback, artifact, **kwargs):
+        self.controller._invalidate_artifact_decompilation(artifact)
+        self.controller.schedule_job(callback, artifact, **kwargs)
 
 
 class IDPHooks(ida_idp.IDP_Hooks):
@@ -539,6 +544,17 @@ class HexRaysHooks:
         if not self._installed:
             return 0
 
+        # user edits in the pseudocode view only change the decompilation of that function
+        if event in (
+            ida_hexrays.lxe_lvar_name_changed, ida_hexrays.lxe_lvar_type_changed,
+            ida_hexrays.lxe_lvar_cmt_changed, ida_hexrays.lxe_lvar_mapping_changed
+        ):
+            vdui = args[0]
+            self.controller._invalidate_decompilation(vdui.cfunc.entry_ea)
+        elif event == ida_hexrays.hxe_cmt_changed:
+            ida_cfunc = args[0]
+            self.controller._invalidate_decompilation(ida_cfunc.entry_ea)
+
         # this event gets triggered each time that a user changes the view to
         # a different decompilation view. It will also get triggered when staying on the
         # same view but having it refreshed
@@ -645,8 +661,9 @@ class HexRaysHooks:
                 if ida_funcs.func_contains(func, ea):
                     vu.refresh_view(False)
 
-    def yodalib_state_change(self, *args, **kwargs):
-        self.controller.schedule_job(*args, **kwargs)
+    def yodalib_state_change(self, callback, artifact, **kwargs):
+        self.controller._invalidate_artifact_decompilation(artifact)
+        self.controller.schedule_job(callback, artifact, **kwargs)
 
 
 class IdaHotkeyHook(ida_kernwin.UI_Hooks):
@@ -9,7 +9,7 @@ import idaapi
 import ida_hexrays
 
 import yodalib
-from yodalib.api.decompiler_interface import DecompilerInterface, artifact_set_event
+from yodalib.api.decompiler_interface import DecompilerInterface
 from yodalib.data import (
     StackVariable, Function, FunctionHeader, Struct, Comment, GlobalVariable, Enum, Patch
 )
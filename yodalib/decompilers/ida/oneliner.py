@@ -1,6 +1,8 @@
 import sys
 import os
+import shutil
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from urllib.request import urlretrieve
 
 # How to run:
@@ -29,7 +31,7 @@ def plugin_install_yodalib(plugins_path):
     ida_yodalib_folder = os.path.join(plugins_path, "ida_yodalib")
 
     # install entry point of yodalib
-    urlretrieve(github_url_base+"ida_yodalib.py", os.path.join(plugins_path, "ida_yodalib.py"))
+    downloads = [(github_url_base+"ida_yodalib.py", os.path.join(plugins_path, "ida_yodalib.py"))]
 
     # install ida_yodalib/*
     github_url_base += "ida_yodalib/"
@@ -38,16 +40,19 @@ def plugin_install_yodalib(plugins_path):
         os.mkdir(ida_yodalib_folder)
     except FileExistsError:
         pass
-    for f in files_to_download:
-        urlretrieve(github_url_base+f, os.path.join(ida_yodalib_folder, f))
+    downloads += [(github_url_base+f, os.path.join(ida_yodalib_folder, f)) for f in files_to_download]
+
+    # downloads are network bound, so overlap them
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda download: urlretrieve(*download), downloads))
 
 
 def pip_install_yodalib(python_path):
     subprocess.run([python_path] + "-m pip install yodalib".split(" "))
     # just in case...
-    location = subprocess.run(["which", "python3"], stdout=subprocess.PIPE)
-    python_path = location.stdout.strip()
-    subprocess.run([python_path.decode()] + "-m pip install git+https://github.com/angr/yodalib".split(" "))
+    # sys.executable is IDA itself here, so fall back to the interpreter we were given
+    python_path = shutil.which("python3") or python_path
+    subprocess.run([python_path] + "-m pip install git+https://github.com/angr/yodalib".split(" "))
 
 
 def install():